@@ -7,46 +7,28 @@ from __future__ import annotations
 
 import argparse
 import datetime
-import importlib.metadata
+import functools
 import json
-import pprint
+import mmap
+import os
 import re
+import stat
 import sys
 import traceback
+from collections.abc import Callable, Mapping, Sequence
+from contextlib import ExitStack
 from dataclasses import dataclass
-from io import StringIO
+from io import BytesIO
 from pathlib import Path
-from typing import (
-    TYPE_CHECKING,
-    Any,
-    Callable,
-    Literal,
-    Mapping,
-    Sequence,
-    Union,
-    cast,
-)
-
-import cbor2  # type: ignore
-import colorama
-import tomlkit
-import tomlkit.items
-from rich_argparse import RichHelpFormatter
-
-try:
-    import tomllib  # type: ignore
-except ModuleNotFoundError:
-    import tomli as tomllib
-
-import ruamel.yaml
-import ruamel.yaml.parser
-import ruamel.yaml.representer
-import ruamel.yaml.scanner
-import umsgpack
+from typing import IO, TYPE_CHECKING, Any, Literal, NoReturn, cast
 
 if TYPE_CHECKING:
+    import tomlkit.items
     from rich.style import StyleType
 
+# Format libraries, including `tomllib`, are imported in the functions
+# that use them so a conversion only pays for the formats involved.
+
 
 class Defaults:
     MAX_VALUES = 1000000
@@ -64,7 +46,7 @@ class Defaults:
     WIDTH = 80
 
 
-Document = Union[bool, bytes, datetime.datetime, Mapping, None, Sequence, str]
+Document = bool | bytes | datetime.datetime | Mapping | None | Sequence | str
 YAMLStyle = Literal["", "'", '"', "|", ">"]
 
 
@@ -143,6 +125,11 @@ __all__ = [
 INPUT_FORMATS = ["cbor", "json", "msgpack", "toml", "yaml"]
 OUTPUT_FORMATS = ["cbor", "json", "msgpack", "python", "toml", "yaml"]
 OUTPUT_FORMATS_ARGV0 = ["cbor", "json", "msgpack", "py", "toml", "yaml"]
+ARGV0_FORMAT_RE = re.compile(
+    f"({'|'.join(INPUT_FORMATS)})2({'|'.join(OUTPUT_FORMATS_ARGV0)})"
+)
+YAML_STYLES = ["", "'", '"', "|", ">"]
+EXTENSION_ALIASES = {"py": "python", "yml": "yaml"}
 OPTIONS_CLASSES = {
     "cbor": CBOROptions,
     "json": JSONOptions,
@@ -152,6 +139,17 @@ OPTIONS_CLASSES = {
     "yaml": YAMLOptions,
 }
 UTF_8 = "utf-8"
+# Key types `_reject_special_keys` accepts without further checks.
+PLAIN_KEY_TYPES = frozenset((str, int, float))
+JSON_SEPARATORS_COMPACT = (",", ":")
+JSON_SEPARATORS_INDENTED = (",", ": ")
+# Input files at least this large are memory-mapped instead of read
+# if their format is in `MMAP_INPUT_FORMATS`.
+MMAP_THRESHOLD = 64 * 1024
+# Formats whose decoders read a mapped file as a stream.
+# The other decoders copy their whole input into `str` or `bytes` anyway,
+# so mapping their input would save nothing.
+MMAP_INPUT_FORMATS = frozenset(("msgpack", "yaml"))
 
 RICH_ARGPARSE_STYLES: dict[str, StyleType] = {
     "argparse.args": "green",
@@ -169,10 +167,7 @@ RICH_ARGPARSE_STYLES: dict[str, StyleType] = {
 
 
 def _argv0_to_format(argv0: str) -> tuple[str, str]:
-    possible_input_format = "(" + "|".join(INPUT_FORMATS) + ")"
-    possible_output_format = "(" + "|".join(OUTPUT_FORMATS_ARGV0) + ")"
-
-    match = re.search("^" + possible_input_format + "2" + possible_output_format, argv0)
+    match = ARGV0_FORMAT_RE.match(argv0)
     from_, to = match.groups() if match else ("", "")
 
     if to == "py":
@@ -183,26 +178,61 @@ def _argv0_to_format(argv0: str) -> tuple[str, str]:
 
 def _extension_to_format(path: str, formats: list[str]) -> str:
     ext = Path(path).suffix[1:]
-
-    if ext == "py":
-        return "python"
-    if ext == "yml":
-        return "yaml"
+    ext = EXTENSION_ALIASES.get(ext, ext)
 
     return ext if ext in formats else ""
 
 
-def _parse_command_line(argv: Sequence[str]) -> argparse.Namespace:
-    me = Path(argv[0]).name
-    argv0_from, argv0_to = _argv0_to_format(me)
-    format_from_argv0 = argv0_to != ""
+def _output_width(value: str) -> int:
+    # This is theoretically compatible with LibYAML.
+    return (1 << 32) - 1 if value.lower() == "inf" else int(value)
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    # Set up Rich and colorama only when there is help or usage to print.
+    # Most runs never print either.
+    # `error` goes on to call `print_usage`, and `_build_parser` reuses
+    # parsers, so only do it once per parser.
+    _rich_ready = False
+
+    def _use_rich(self) -> None:
+        if self._rich_ready:
+            return
+        self._rich_ready = True
 
-    RichHelpFormatter.group_name_formatter = lambda x: x
-    RichHelpFormatter.styles = RICH_ARGPARSE_STYLES
+        import colorama
+        from rich_argparse import RichHelpFormatter
 
-    parser = argparse.ArgumentParser(
+        RichHelpFormatter.group_name_formatter = lambda x: x
+        RichHelpFormatter.styles = RICH_ARGPARSE_STYLES
+        self.formatter_class = RichHelpFormatter
+
+        colorama.init()
+
+    def error(self, message: str) -> NoReturn:
+        self._use_rich()
+        super().error(message)
+
+    def print_help(self, file: IO[str] | None = None) -> None:
+        self._use_rich()
+        super().print_help(file)
+
+    def print_usage(self, file: IO[str] | None = None) -> None:
+        self._use_rich()
+        super().print_usage(file)
+
+    # Looked up by the "version" action only when `--version` is given.
+    @property
+    def version(self) -> str:
+        import importlib.metadata
+
+        return importlib.metadata.version("remarshal")
+
+
+@functools.cache
+def _build_parser(*, format_from_argv0: bool) -> argparse.ArgumentParser:
+    parser = _ArgumentParser(
         description="Convert between CBOR, JSON, MessagePack, TOML, and YAML.",
-        formatter_class=RichHelpFormatter,
         prog="remarshal",
     )
 
@@ -210,7 +240,6 @@ def _parse_command_line(argv: Sequence[str]) -> argparse.Namespace:
         "-v",
         "--version",
         action="version",
-        version=importlib.metadata.version("remarshal"),
     )
 
     if not format_from_argv0:
@@ -357,15 +386,11 @@ def _parse_command_line(argv: Sequence[str]) -> argparse.Namespace:
         help="print debug information when an error occurs",
     )
 
-    def output_width(value: str) -> int:
-        # This is theoretically compatible with LibYAML.
-        return (1 << 32) - 1 if value.lower() == "inf" else int(value)
-
     parser.add_argument(
         "--width",
         default=Defaults.WIDTH,
         metavar="<n>",
-        type=output_width,  # Allow "inf".
+        type=_output_width,  # Allow "inf".
         help=(
             "Python line width and YAML line width for long strings"
             " (integer or 'inf')"
@@ -388,19 +413,28 @@ def _parse_command_line(argv: Sequence[str]) -> argparse.Namespace:
 
     parser.add_argument(
         "--yaml-style",
-        choices=["", "'", '"', "|", ">"],
-        default=YAMLOptions().style,
+        choices=YAML_STYLES,
+        default=Defaults.YAML_STYLE,
         help="YAML formatting style",
     )
 
     parser.add_argument(
         "--yaml-width",
         dest="width",
-        type=output_width,
+        type=_output_width,
         help=argparse.SUPPRESS,
     )
 
-    colorama.init()
+    return parser
+
+
+def _parse_command_line(argv: Sequence[str]) -> argparse.Namespace:
+    me = Path(argv[0]).name
+    argv0_from, argv0_to = _argv0_to_format(me)
+    format_from_argv0 = argv0_to != ""
+
+    parser = _build_parser(format_from_argv0=format_from_argv0)
+
     args = parser.parse_args(args=argv[1:])
 
     # Use the positional input and output arguments.
@@ -435,6 +469,32 @@ def identity(x: Any) -> Any:
     return x
 
 
+def _leaf_callback(
+    instance_callbacks: Sequence[tuple[type, Any]],
+    default_callback: Callable[[Any], Any],
+) -> Callable[[Any], Any]:
+    # The callback chosen for a value depends only on its type,
+    # so remember it per type instead of rescanning `instance_callbacks`.
+    callbacks: dict[type, Callable[[Any], Any]] = {}
+
+    def leaf(x: Any) -> Any:
+        callback = callbacks.get(type(x))
+
+        if callback is None:
+            for t, instance_callback in instance_callbacks:
+                if isinstance(x, t):
+                    callback = instance_callback
+                    break
+            else:
+                callback = default_callback
+
+            callbacks[type(x)] = callback
+
+        return callback(x)
+
+    return leaf
+
+
 def traverse(
     col: Any,
     dict_callback: Callable[[Sequence[tuple[Any, Any]]], Any] = dict,
@@ -443,49 +503,78 @@ def traverse(
     instance_callbacks: Sequence[tuple[type, Any]] = (),
     default_callback: Callable[[Any], Any] = identity,
 ) -> Any:
-    if isinstance(col, dict):
-        res = dict_callback(
-            [
-                (
-                    key_callback(k),
-                    traverse(
-                        v,
-                        dict_callback,
-                        list_callback,
-                        key_callback,
-                        instance_callbacks,
-                        default_callback,
-                    ),
-                )
-                for (k, v) in col.items()
-            ]
-        )
-    elif isinstance(col, list):
-        res = list_callback(
-            [
-                traverse(
-                    x,
-                    dict_callback,
-                    list_callback,
-                    key_callback,
-                    instance_callbacks,
-                    default_callback,
+    leaf = _leaf_callback(instance_callbacks, default_callback)
+
+    if not isinstance(col, (dict, list)):
+        return leaf(col)
+
+    # Skip calling callbacks that would return their argument unchanged.
+    key_identity = key_callback is identity
+    leaf_identity = not instance_callbacks and default_callback is identity
+    list_identity = list_callback is identity
+
+    # Walk the document with an explicit stack to avoid Python recursion.
+    # Each frame holds a container, an iterator over its items,
+    # the results collected so far, and the already-transformed key
+    # under which the container's result goes in its parent.
+    # Containers on the stack are tracked by `id` to detect cycles,
+    # which YAML anchors and aliases can create.
+    stack: list[tuple[Any, Any, list[Any], Any]] = [
+        (col, iter(col.items() if isinstance(col, dict) else col), [], None)
+    ]
+    active = {id(col)}
+
+    while True:
+        node, items, results, slot_key = stack[-1]
+        is_dict = isinstance(node, dict)
+
+        for item in items:
+            if is_dict:
+                key, value = item
+                if not key_identity:
+                    key = key_callback(key)
+            else:
+                key = None
+                value = item
+
+            if isinstance(value, (dict, list)):
+                if id(value) in active:
+                    msg = "circular reference detected"
+                    raise ValueError(msg)
+
+                active.add(id(value))
+                stack.append(
+                    (
+                        value,
+                        iter(value.items() if isinstance(value, dict) else value),
+                        [],
+                        key,
+                    )
                 )
-                for x in col
-            ]
-        )
-    else:
-        for t, callback in instance_callbacks:
-            if isinstance(col, t):
-                res = callback(col)
                 break
+
+            if not leaf_identity:
+                value = leaf(value)
+
+            results.append((key, value) if is_dict else value)
         else:
-            res = default_callback(col)
+            stack.pop()
+            active.discard(id(node))
+            if is_dict:
+                res = dict_callback(results)
+            else:
+                res = results if list_identity else list_callback(results)
+
+            if not stack:
+                return res
 
-    return res
+            parent, _, parent_results, _ = stack[-1]
+            parent_results.append((slot_key, res) if isinstance(parent, dict) else res)
 
 
-def _decode_cbor(input_data: bytes) -> Document:
+def _decode_cbor(input_data: bytes | mmap.mmap) -> Document:
+    import cbor2  # type: ignore
+
     try:
         doc = cbor2.loads(input_data)
         return cast(Document, doc)
@@ -494,10 +583,10 @@ def _decode_cbor(input_data: bytes) -> Document:
         raise ValueError(msg)
 
 
-def _decode_json(input_data: bytes) -> Document:
+def _decode_json(input_data: bytes | mmap.mmap) -> Document:
     try:
         doc = json.loads(
-            input_data.decode(UTF_8),
+            str(input_data, UTF_8),
         )
 
         return cast(Document, doc)
@@ -506,25 +595,38 @@ def _decode_json(input_data: bytes) -> Document:
         raise ValueError(msg)
 
 
-def _decode_msgpack(input_data: bytes) -> Document:
+def _decode_msgpack(input_data: bytes | mmap.mmap) -> Document:
+    import umsgpack
+
     try:
-        doc = umsgpack.unpackb(input_data)
+        doc = (
+            umsgpack.unpackb(input_data)
+            if isinstance(input_data, bytes)
+            else umsgpack.unpack(input_data)
+        )
         return cast(Document, doc)
     except umsgpack.UnpackException as e:
         msg = f"Cannot parse as MessagePack ({e})"
         raise ValueError(msg)
 
 
-def _decode_toml(input_data: bytes) -> Document:
+def _decode_toml(input_data: bytes | mmap.mmap) -> Document:
+    try:
+        import tomllib  # type: ignore
+    except ModuleNotFoundError:
+        import tomli as tomllib
+
     try:
-        doc = tomllib.loads(input_data.decode(UTF_8))
+        doc = tomllib.loads(str(input_data, UTF_8))
         return cast(Document, doc)
     except tomllib.TOMLDecodeError as e:
         msg = f"Cannot parse as TOML ({e})"
         raise ValueError(msg)
 
 
-def _decode_yaml(input_data: bytes) -> Document:
+def _decode_yaml(input_data: bytes | mmap.mmap) -> Document:
+    import ruamel.yaml
+
     try:
         yaml = ruamel.yaml.YAML(pure=True, typ="safe")
         doc = yaml.load(input_data)
@@ -536,20 +638,23 @@ def _decode_yaml(input_data: bytes) -> Document:
         raise ValueError(msg)
 
 
-def decode(input_format: str, input_data: bytes) -> Document:
-    decoder = {
-        "cbor": _decode_cbor,
-        "json": _decode_json,
-        "msgpack": _decode_msgpack,
-        "toml": _decode_toml,
-        "yaml": _decode_yaml,
-    }
+DECODERS: dict[str, Callable[[bytes | mmap.mmap], Document]] = {
+    "cbor": _decode_cbor,
+    "json": _decode_json,
+    "msgpack": _decode_msgpack,
+    "toml": _decode_toml,
+    "yaml": _decode_yaml,
+}
+
+
+def decode(input_format: str, input_data: bytes | mmap.mmap) -> Document:
+    decoder = DECODERS.get(input_format)
 
-    if input_format not in decoder:
+    if decoder is None:
         msg = f"Unknown input format: {input_format}"
         raise ValueError(msg)
 
-    return decoder[input_format](input_data)
+    return decoder(input_data)
 
 
 class TooManyValuesError(BaseException):
@@ -572,22 +677,27 @@ def _validate_value_count(doc: Document, *, maximum: int) -> None:
 
         return x
 
-    traverse(doc, instance_callbacks=[(object, count_callback)])
+    # Count every occurrence of a shared container.
+    # This is what limits YAML alias expansion ("billion laughs").
+    _check_document(doc, value_callback=count_callback, shared_once=False)
 
 
 def _reject_special_keys(key: Any) -> Any:
+    if type(key) in PLAIN_KEY_TYPES:
+        return key
+
     if isinstance(key, bool):
         msg = "boolean key"
         raise TypeError(msg)
 
-    if isinstance(key, datetime.date):
-        msg = "date key"
-        raise TypeError(msg)
-
     if isinstance(key, datetime.datetime):
         msg = "date-time key"
         raise TypeError(msg)
 
+    if isinstance(key, datetime.date):
+        msg = "date key"
+        raise TypeError(msg)
+
     if isinstance(key, datetime.time):
         msg = "time key"
         raise TypeError(msg)
@@ -599,7 +709,82 @@ def _reject_special_keys(key: Any) -> Any:
     return key
 
 
+def _check_document(
+    data: Document,
+    *,
+    key_callback: Callable[[Any], Any] | None = None,
+    value_callback: Callable[[Any], Any] | None = None,
+    shared_once: bool = True,
+) -> None:
+    # Pass every key and every non-container value to the callbacks
+    # without copying the document.
+    # The walk is in document order and passes each key before the value
+    # under it, so the first problem reported is the one a recursive walk
+    # would find first.
+    # Containers reachable more than once are only checked once
+    # unless `shared_once` is false.
+    # A container that contains itself is an error like in `traverse`,
+    # since the encoders would otherwise recurse on it forever.
+    if not isinstance(data, (dict, list)):
+        if value_callback is not None:
+            value_callback(data)
+        return
+
+    stack: list[tuple[Any, Any]] = [
+        (data, iter(data.items() if isinstance(data, dict) else data))
+    ]
+    active = {id(data)}
+    seen = {id(data)}
+
+    while stack:
+        node, items = stack[-1]
+        is_dict = isinstance(node, dict)
+
+        for item in items:
+            if is_dict:
+                key, value = item
+                if key_callback is not None:
+                    key_callback(key)
+            else:
+                value = item
+
+            if isinstance(value, (dict, list)):
+                if id(value) in active:
+                    msg = "circular reference detected"
+                    raise ValueError(msg)
+                if shared_once:
+                    if id(value) in seen:
+                        continue
+                    seen.add(id(value))
+
+                active.add(id(value))
+                stack.append(
+                    (value, iter(value.items() if isinstance(value, dict) else value))
+                )
+                break
+
+            if value_callback is not None:
+                value_callback(value)
+        else:
+            stack.pop()
+            active.discard(id(node))
+
+
+class _SpecialKeyError(Exception):
+    pass
+
+
+def _require_json_keys(key: Any) -> None:
+    # `json.dumps` turns `str` and `int` keys into the same strings
+    # as `_stringify_special_keys`, so only other keys need converting.
+    if type(key) not in (str, int):
+        raise _SpecialKeyError
+
+
 def _stringify_special_keys(key: Any) -> Any:
+    if type(key) is str:
+        return key
+
     if isinstance(key, bool):
         return "true" if key else "false"
     if isinstance(key, (datetime.date, datetime.datetime, datetime.time)):
@@ -611,8 +796,10 @@ def _stringify_special_keys(key: Any) -> Any:
 
 
 def _encode_cbor(data: Document) -> bytes:
+    import cbor2  # type: ignore
+
     try:
-        return bytes(cbor2.dumps(data))
+        return cbor2.dumps(data)
     except cbor2.CBOREncodeError as e:
         msg = f"Cannot convert data to CBOR ({e})"
         raise ValueError(msg)
@@ -632,22 +819,23 @@ def _encode_json(
     sort_keys: bool,
     stringify: bool,
 ) -> str:
-    separators = (",", ": " if indent else ":")
+    separators = JSON_SEPARATORS_INDENTED if indent else JSON_SEPARATORS_COMPACT
 
-    if stringify:
-        default_callback = _json_default_stringify
-        key_callback = _stringify_special_keys
-    else:
-        default_callback = None
-        key_callback = _reject_special_keys
+    default_callback = _json_default_stringify if stringify else None
 
     try:
+        if stringify:
+            # Only copy the document when it has keys to convert.
+            try:
+                _check_document(data, key_callback=_require_json_keys)
+            except _SpecialKeyError:
+                data = traverse(data, key_callback=_stringify_special_keys)
+        else:
+            _check_document(data, key_callback=_reject_special_keys)
+
         return (
             json.dumps(
-                traverse(
-                    data,
-                    key_callback=key_callback,
-                ),
+                data,
                 default=default_callback,
                 ensure_ascii=False,
                 indent=indent,
@@ -661,21 +849,20 @@ def _encode_json(
         raise ValueError(msg)
 
 
-def _msgpack_reject_local_datetime(obj: datetime.datetime) -> None:
-    if obj.tzinfo is None:
+def _msgpack_reject_local_datetime(obj: Any) -> None:
+    if isinstance(obj, datetime.datetime) and obj.tzinfo is None:
         msg = "'datetime.datetime' without a time zone is unsupported"
         raise TypeError(msg)
 
 
 def _encode_msgpack(data: Document) -> bytes:
+    import umsgpack
+
     try:
-        traverse(
-            data,
-            instance_callbacks=[(datetime.datetime, _msgpack_reject_local_datetime)],
-        )
+        _check_document(data, value_callback=_msgpack_reject_local_datetime)
 
         return umsgpack.packb(data)
-    except (TypeError, umsgpack.UnsupportedTypeException) as e:
+    except (TypeError, ValueError, umsgpack.UnsupportedTypeException) as e:
         msg = f"Cannot convert data to MessagePack ({e})"
         raise ValueError(msg)
 
@@ -687,15 +874,16 @@ def _encode_python(
     sort_keys: bool,
     width: int,
 ) -> str:
-    code = (
-        repr(data)
-        if indent is None
-        else pprint.pformat(
-            data,
-            indent=indent,
-            sort_dicts=sort_keys,
-            width=width,
-        )
+    if indent is None:
+        return repr(data) + "\n"
+
+    import pprint
+
+    code = pprint.pformat(
+        data,
+        indent=indent,
+        sort_dicts=sort_keys,
+        width=width,
     )
 
     return code + "\n"
@@ -708,8 +896,6 @@ def _encode_toml(
     sort_keys: bool,
     stringify: bool,
 ) -> str:
-    key_callback = _stringify_special_keys if stringify else _reject_special_keys
-
     def reject_null(x: Any) -> Any:
         if x is None:
             msg = "null values are not supported"
@@ -723,17 +909,25 @@ def _encode_toml(
 
         return x
 
-    default_callback = stringify_null if stringify else reject_null
+    import tomlkit
+    import tomlkit.items
 
     try:
-        toml = tomlkit.item(
-            traverse(
+        # Only copy the document when keys and nulls need rewriting.
+        if stringify:
+            data = traverse(
                 data,
-                key_callback=key_callback,
-                default_callback=default_callback,
-            ),
-            _sort_keys=sort_keys,
-        )
+                key_callback=_stringify_special_keys,
+                default_callback=stringify_null,
+            )
+        else:
+            _check_document(
+                data,
+                key_callback=_reject_special_keys,
+                value_callback=reject_null,
+            )
+
+        toml = tomlkit.item(data, _sort_keys=sort_keys)
 
         def multilinify(item: tomlkit.items.Item) -> None:
             match item:
@@ -772,7 +966,9 @@ def _encode_yaml(
     indent: int | None,
     style: YAMLStyle,
     width: int,
-) -> str:
+) -> bytes:
+    import ruamel.yaml
+
     yaml = ruamel.yaml.YAML(pure=True)
     yaml.default_flow_style = False
 
@@ -783,7 +979,9 @@ def _encode_yaml(
     yaml.representer.add_representer(type(None), _yaml_represent_none)
 
     try:
-        out = StringIO()
+        # Dumping to a binary stream makes ruamel.yaml encode the output
+        # as it writes instead of building a `str` for us to encode.
+        out = BytesIO()
         yaml.dump(
             data,
             out,
@@ -920,7 +1118,7 @@ def encode(
                 indent=options.indent,
                 style=options.style,
                 width=options.width,
-            ).encode(UTF_8)
+            )
 
         case _:
             msg = f"Unknown output format: {output_format}"
@@ -932,11 +1130,27 @@ def encode(
 # === Main ===
 
 
+def _map_input(fd: int) -> mmap.mmap | None:
+    # Let a streaming decoder read a large file straight from the page cache
+    # instead of copying it into a `bytes` object first.
+    # Return `None` to have the caller read the file normally
+    # when it is small, not a regular file, or cannot be mapped
+    # (some FUSE file systems, for example).
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode) or st.st_size < MMAP_THRESHOLD:
+        return None
+
+    try:
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
 def remarshal(
     input_format: str,
     output_format: str,
     input: Path | str,
-    output: Path | str,
+    output: Path | str | IO[bytes],
     *,
     max_values: int = Defaults.MAX_VALUES,
     options: FormatOptions | None = None,
@@ -944,20 +1158,37 @@ def remarshal(
     unwrap: str | None = None,
     wrap: str | None = None,
 ) -> None:
-    input_file = None
-    output_file = None
-
     if options is None:
         options = format_options(output_format)
 
-    try:
-        input_file = sys.stdin.buffer if input == "-" else Path(input).open("rb")
-        output_file = sys.stdout.buffer if output == "-" else Path(output).open("wb")
-
-        input_data = input_file.read()
-        if not isinstance(input_data, bytes):
-            msg = "'input_data' must be 'bytes'"
-            raise TypeError(msg)
+    with ExitStack() as stack:
+        # Input files are opened unbuffered.
+        # `FileIO.read()` sizes its buffer from `fstat` and reads in one call.
+        input_file = (
+            sys.stdin.buffer
+            if input == "-"
+            else stack.enter_context(Path(input).open("rb", buffering=0))
+        )
+        output_file: IO[bytes]
+        if output == "-":
+            output_file = sys.stdout.buffer
+        elif isinstance(output, Path | str):
+            output_file = stack.enter_context(Path(output).open("wb"))
+        else:
+            # Write to a binary stream the caller owns, e.g., `io.BytesIO`.
+            output_file = output
+
+        input_data: bytes | mmap.mmap | None = None
+        if input != "-" and input_format in MMAP_INPUT_FORMATS:
+            input_data = _map_input(input_file.fileno())
+            if input_data is not None:
+                stack.enter_context(input_data)
+
+        if input_data is None:
+            input_data = input_file.read()
+            if not isinstance(input_data, bytes):
+                msg = "'input_data' must be 'bytes'"
+                raise TypeError(msg)
 
         parsed = decode(input_format, input_data)
 
@@ -972,9 +1203,7 @@ def remarshal(
                 raise TypeError(msg)
             parsed = parsed[unwrap]
         if wrap is not None:
-            temp = {}
-            temp[wrap] = parsed
-            parsed = temp
+            parsed = {wrap: parsed}
 
         if transform:
             parsed = transform(parsed)
@@ -986,11 +1215,6 @@ def remarshal(
         )
 
         output_file.write(encoded)
-    finally:
-        if input_file is not None:
-            input_file.close()
-        if output != "-" and output_file is not None:
-            output_file.close()
 
 
 def main() -> None:
@@ -9,99 +9,124 @@ import datetime
 import errno
 import functools
 import inspect
+import json
+import mmap
+import os
 import re
-import secrets
 import sys
+from io import BytesIO
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, NoReturn
 
 import cbor2  # type: ignore
 import pytest
 
 import remarshal
 from remarshal.main import (
+    MMAP_THRESHOLD,
     Defaults,
-    FormatOptions,
     YAMLStyle,
+    _ArgumentParser,
     _argv0_to_format,
+    _map_input,
     _parse_command_line,
+    _reject_special_keys,
+    _validate_value_count,
 )
 
 if TYPE_CHECKING:
-    from collections.abc import Mapping, Sequence
+    from collections.abc import Sequence
 
 TEST_PATH = Path(__file__).resolve().parent
 
+# These live in the repository root rather than in the test directory.
+EXAMPLE_FILES = {
+    f"example.{ext}" for ext in ("cbor", "json", "msgpack", "py", "toml", "yaml")
+}
+
+# A trailing comment or any run of spaces.
+TOML_STRIP_RE = re.compile(r" *#.*$| +")
+# Lines that start a `hosts` key or continue a multiline string array.
+TOML_DROP_RE = re.compile(r'hosts|".*",?$')
+YAML_INDENT_RE = re.compile(r"\n +")
+
+REMARSHAL_PARAMS = frozenset(inspect.signature(remarshal.remarshal).parameters)
+
 
 def data_file_path(filename: str) -> str:
     path_list = []
-    if re.match(r"example\.(json|msgpack|py|toml|yaml|cbor)$", filename):
+    if filename in EXAMPLE_FILES:
         path_list.append("..")
     path_list.append(filename)
     return str(TEST_PATH.joinpath(*path_list))
 
 
+@functools.cache
 def read_file(filename: str) -> bytes:
-    with Path(data_file_path(filename)).open("rb") as f:
-        return f.read()
+    return Path(data_file_path(filename)).read_bytes()
 
 
 def run(*argv: str) -> None:
-    # The `list()` call is to satisfy the type checker.
-    args_d = vars(_parse_command_line(list(argv)))
-    sig = inspect.signature(remarshal.remarshal)
-    re_args = {param: args_d[param] for param in sig.parameters if param in args_d}
+    args_d = vars(_parse_command_line(argv))
+    re_args = {
+        param: value for param, value in args_d.items() if param in REMARSHAL_PARAMS
+    }
 
     remarshal.remarshal(**re_args)
 
 
-def assert_cbor_same(output: bytes, reference: bytes) -> None:
-    # To date, Python's CBOR libraries don't support encoding to
-    # canonical-form CBOR, so we have to parse and deep-compare.
-    output_dec = cbor2.loads(output)
-    reference_dec = cbor2.loads(reference)
-    assert output_dec == reference_dec
+def canonical_cbor(data: bytes) -> bytes:
+    return cbor2.dumps(cbor2.loads(data), canonical=True)
 
 
-def sorted_dict(pairs: Sequence[tuple[Any, Any]]) -> Mapping[Any, Any]:
-    return dict(sorted(pairs))
+# Reference files are few and fixed, so re-encode each one only once.
+canonical_cbor_reference = functools.cache(canonical_cbor)
+
+
+def assert_cbor_same(output: bytes, reference: bytes) -> None:
+    # Map key order is not significant, so we re-encode both sides
+    # as canonical-form CBOR (sorted keys, shortest encodings) and compare.
+    assert canonical_cbor(output) == canonical_cbor_reference(reference)
 
 
-def toml_signature(data: bytes | str) -> list[str]:
+def toml_signature(data: bytes | str) -> tuple[str, ...]:
     """Return a lossy representation of TOML example data for comparison."""
 
     def strip_more(line: str) -> str:
-        return re.sub(r" *#.*$", "", line.strip()).replace(" ", "")
+        return TOML_STRIP_RE.sub("", line.strip())
 
-    def sig_lines(lst: Sequence[str]) -> list[str]:
+    def sig_lines(lst: Sequence[str]) -> tuple[str, ...]:
         def should_drop(line: str) -> bool:
             return (
                 line.startswith("#")
                 or line in ("", "]")
-                or bool(re.match(r'^".*",?$', line))
-                or bool(re.match(r"^hosts", line))
+                or bool(TOML_DROP_RE.match(line))
             )
 
-        return sorted(
-            [strip_more(line) for line in lst if not should_drop(strip_more(line))]
+        return tuple(
+            sorted(line for line in map(strip_more, lst) if not should_drop(line))
         )
 
-    str_data = data if isinstance(data, str) else bytes(data).decode("utf-8")
+    str_data = data if isinstance(data, str) else data.decode("utf-8")
 
     return sig_lines(str_data.split("\n"))
 
 
+# Reference signatures are cached like `canonical_cbor_reference`.
+# Signatures are tuples, so sharing a cached one between tests is safe.
+toml_signature_reference = functools.cache(toml_signature)
+
+
 output_file = None
 
 
-def _convert_and_read(  # noqa: PLR0913
+def _convert_and_read(
     input_filename: str,
     input_format: str,
     output_format: str,
     *,
     indent: int | None = None,
     multiline_threshold: int = Defaults.MULTILINE_THRESHOLD,
-    output_filename: str,
     sort_keys: bool = False,
     stringify: bool = False,
     transform: Callable[[remarshal.Document], remarshal.Document] | None = None,
@@ -109,7 +134,6 @@ def _convert_and_read(  # noqa: PLR0913
     width: int = Defaults.WIDTH,
     wrap: str | None = None,
     yaml_style: YAMLStyle = Defaults.YAML_STYLE,
-    options: FormatOptions | None = None,
 ) -> bytes:
     options = remarshal.format_options(
         output_format,
@@ -121,25 +145,24 @@ def _convert_and_read(  # noqa: PLR0913
         yaml_style=yaml_style,
     )
 
+    output = BytesIO()
     remarshal.remarshal(
         input_format,
         output_format,
         data_file_path(input_filename),
-        output_filename,
+        output,
         options=options,
         transform=transform,
         unwrap=unwrap,
         wrap=wrap,
     )
 
-    return read_file(output_filename)
+    return output.getvalue()
 
 
 @pytest.fixture
-def convert_and_read(tmp_path):
-    return functools.partial(
-        _convert_and_read, output_filename=str(tmp_path / secrets.token_hex(16))
-    )
+def convert_and_read():
+    return _convert_and_read
 
 
 def patch_date(x: Any) -> Any:
@@ -150,68 +173,164 @@ def patch_date(x: Any) -> Any:
     return x
 
 
-class TestRemarshal:
-    def test_cbor2cbor(self, convert_and_read) -> None:
-        output = convert_and_read("example.cbor", "cbor", "cbor")
-        reference = read_file("example.cbor")
-        assert_cbor_same(output, reference)
-
-    def test_json2json(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.json",
-            "json",
-            "json",
-            indent=Defaults.JSON_INDENT,
-        )
-        reference = read_file("example.json")
-        assert output == reference
-
-    def test_msgpack2msgpack(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.msgpack",
-            "msgpack",
-            "msgpack",
-            sort_keys=False,
-        )
-        reference = read_file("example.msgpack")
-        assert output == reference
-
-    def test_toml2toml(self, convert_and_read) -> None:
-        output = convert_and_read("example.toml", "toml", "toml")
-        reference = read_file("example.toml")
-        assert toml_signature(output) == toml_signature(reference)
+EXAMPLE_CONVERSIONS = [
+    pytest.param("cbor", "cbor", {}, id="cbor2cbor"),
+    pytest.param("json", "json", {"indent": Defaults.JSON_INDENT}, id="json2json"),
+    pytest.param("msgpack", "msgpack", {}, id="msgpack2msgpack"),
+    pytest.param("toml", "toml", {}, id="toml2toml"),
+    pytest.param("yaml", "yaml", {}, id="yaml2yaml"),
+    pytest.param("json", "cbor", {"transform": patch_date}, id="json2cbor"),
+    pytest.param("json", "msgpack", {"transform": patch_date}, id="json2msgpack"),
+    pytest.param(
+        "json",
+        "python",
+        {"indent": Defaults.PYTHON_INDENT, "transform": patch_date},
+        id="json2python",
+    ),
+    pytest.param("msgpack", "cbor", {}, id="msgpack2cbor"),
+    pytest.param(
+        "msgpack",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="msgpack2json",
+    ),
+    pytest.param(
+        "msgpack", "python", {"indent": Defaults.PYTHON_INDENT}, id="msgpack2python"
+    ),
+    pytest.param("msgpack", "toml", {}, id="msgpack2toml"),
+    pytest.param("msgpack", "yaml", {}, id="msgpack2yaml"),
+    pytest.param("toml", "cbor", {}, id="toml2cbor"),
+    pytest.param(
+        "toml",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="toml2json",
+    ),
+    pytest.param("toml", "msgpack", {}, id="toml2msgpack"),
+    pytest.param(
+        "toml", "python", {"indent": Defaults.PYTHON_INDENT}, id="toml2python"
+    ),
+    pytest.param("toml", "yaml", {}, id="toml2yaml"),
+    pytest.param("yaml", "cbor", {}, id="yaml2cbor"),
+    pytest.param(
+        "yaml",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="yaml2json",
+    ),
+    pytest.param("yaml", "msgpack", {}, id="yaml2msgpack"),
+    pytest.param(
+        "yaml",
+        "python",
+        {"indent": Defaults.PYTHON_INDENT, "transform": patch_date},
+        id="yaml2python",
+    ),
+    pytest.param("yaml", "toml", {}, id="yaml2toml"),
+    pytest.param(
+        "cbor",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="cbor2json",
+    ),
+    pytest.param("cbor", "msgpack", {}, id="cbor2msgpack"),
+    pytest.param("cbor", "toml", {}, id="cbor2toml"),
+    pytest.param("cbor", "yaml", {}, id="cbor2yaml"),
+]
+
+
+# TOML date and time values and the formats that can represent them.
+DATETIME_CONVERSIONS = [
+    pytest.param("date", "cbor", {}, id="date-cbor"),
+    pytest.param(
+        "date",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="date-json-stringify",
+    ),
+    pytest.param("date", "toml", {}, id="date-toml"),
+    pytest.param("date", "yaml", {}, id="date-yaml"),
+    pytest.param(
+        "datetime-local",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="datetime-local-json-stringify",
+    ),
+    pytest.param("datetime-local", "toml", {}, id="datetime-local-toml"),
+    pytest.param("datetime-local", "yaml", {}, id="datetime-local-yaml"),
+    pytest.param("datetime-tz", "cbor", {}, id="datetime-tz-cbor"),
+    pytest.param(
+        "datetime-tz",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="datetime-tz-json-stringify",
+    ),
+    pytest.param("datetime-tz", "msgpack", {}, id="datetime-tz-msgpack"),
+    pytest.param("datetime-tz", "toml", {}, id="datetime-tz-toml"),
+    pytest.param("datetime-tz", "yaml", {}, id="datetime-tz-yaml"),
+    pytest.param(
+        "time",
+        "json",
+        {"indent": Defaults.JSON_INDENT, "stringify": True},
+        id="time-json-stringify",
+    ),
+    pytest.param("time", "toml", {}, id="time-toml"),
+]
+
+DATETIME_FAILURES = [
+    ("date", "json"),
+    ("date", "msgpack"),
+    ("datetime-local", "cbor"),
+    ("datetime-local", "json"),
+    ("datetime-local", "msgpack"),
+    ("datetime-tz", "json"),
+    ("time", "cbor"),
+    ("time", "json"),
+    ("time", "msgpack"),
+    ("time", "yaml"),
+]
+
+
+# Output formats exercised through `json2<format>` program names.
+SHORT_COMMAND_FORMATS = ["cbor", "json", "msgpack", "toml", "yaml"]
+
+# Formats with key-order fixtures (`order.*` and `sorted.*`).
+ORDER_FORMATS = ["json", "toml"]
+
+# File extensions and the formats detected from them.
+DETECTED_FORMATS = [
+    ("json", "json"),
+    ("toml", "toml"),
+    ("yaml", "yaml"),
+    ("yml", "yaml"),
+]
+
+
+def example_file(format_name: str) -> str:
+    return "example." + ("py" if format_name == "python" else format_name)
 
-    def test_yaml2yaml(self, convert_and_read) -> None:
-        output = convert_and_read("example.yaml", "yaml", "yaml")
-        reference = read_file("example.yaml")
-        assert output == reference
 
-    def test_json2cbor(self, convert_and_read) -> None:
+class TestRemarshal:
+    @pytest.mark.parametrize(
+        ("input_format", "output_format", "kwargs"), EXAMPLE_CONVERSIONS
+    )
+    def test_example(
+        self,
+        convert_and_read,
+        input_format: str,
+        output_format: str,
+        kwargs: dict[str, Any],
+    ) -> None:
         output = convert_and_read(
-            "example.json",
-            "json",
-            "msgpack",
-            transform=patch_date,
+            example_file(input_format), input_format, output_format, **kwargs
         )
-        reference = read_file("example.msgpack")
-        assert output == reference
+        reference = read_file(example_file(output_format))
 
-    def test_json2python(self, convert_and_read) -> None:
-        def patch(x: Any) -> Any:
-            x["owner"]["dob"] = datetime.datetime(
-                1979, 5, 27, 7, 32, tzinfo=datetime.timezone.utc
-            )
-            return x
-
-        output = convert_and_read(
-            "example.json",
-            "json",
-            "python",
-            indent=Defaults.PYTHON_INDENT,
-            transform=patch,
-        )
-        reference = read_file("example.py")
-        assert output == reference
+        if output_format == "cbor":
+            assert_cbor_same(output, reference)
+        elif output_format == "toml":
+            assert toml_signature(output) == toml_signature_reference(reference)
+        else:
+            assert output == reference
 
     def test_json2toml(self, convert_and_read) -> None:
         output = convert_and_read("example.json", "json", "toml").decode("utf-8")
@@ -251,164 +370,6 @@ class TestRemarshal:
         )
         assert output == reference_patched
 
-    def test_msgpack2cbor(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.msgpack",
-            "msgpack",
-            "cbor",
-        )
-        reference = read_file("example.cbor")
-        assert_cbor_same(output, reference)
-
-    def test_msgpack2json(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.msgpack",
-            "msgpack",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("example.json")
-        assert output == reference
-
-    def test_msgpack2python(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.msgpack", "msgpack", "python", indent=Defaults.PYTHON_INDENT
-        )
-        reference = read_file("example.py")
-        assert output == reference
-
-    def test_msgpack2toml(self, convert_and_read) -> None:
-        output = convert_and_read("example.msgpack", "msgpack", "toml")
-        reference = read_file("example.toml")
-        assert toml_signature(output) == toml_signature(reference)
-
-    def test_msgpack2yaml(self, convert_and_read) -> None:
-        output = convert_and_read("example.msgpack", "msgpack", "yaml")
-        reference = read_file("example.yaml")
-        assert output == reference
-
-    def test_toml2cbor(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.toml",
-            "toml",
-            "cbor",
-        )
-        reference = read_file("example.cbor")
-        assert_cbor_same(output, reference)
-
-    def test_toml2json(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.toml",
-            "toml",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("example.json")
-        assert output == reference
-
-    def test_toml2msgpack(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.toml",
-            "toml",
-            "msgpack",
-        )
-        reference = read_file("example.msgpack")
-        assert output == reference
-
-    def test_toml2python(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.toml",
-            "toml",
-            "python",
-            indent=Defaults.PYTHON_INDENT,
-        )
-        reference = read_file("example.py")
-        assert output == reference
-
-    def test_toml2yaml(self, convert_and_read) -> None:
-        output = convert_and_read("example.toml", "toml", "yaml")
-        reference = read_file("example.yaml")
-        assert output == reference
-
-    def test_yaml2cbor(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.yaml",
-            "yaml",
-            "cbor",
-        )
-        reference = read_file("example.cbor")
-        assert_cbor_same(output, reference)
-
-    def test_yaml2json(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.yaml",
-            "yaml",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("example.json")
-        assert output == reference
-
-    def test_yaml2msgpack(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.yaml",
-            "yaml",
-            "msgpack",
-        )
-        reference = read_file("example.msgpack")
-        assert output == reference
-
-    def test_yaml2python(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.yaml",
-            "yaml",
-            "python",
-            indent=Defaults.PYTHON_INDENT,
-            transform=patch_date,
-        )
-        reference = read_file("example.py")
-        assert output == reference
-
-    def test_yaml2toml(self, convert_and_read) -> None:
-        output = convert_and_read("example.yaml", "yaml", "toml")
-        reference = read_file("example.toml")
-        assert toml_signature(output) == toml_signature(reference)
-
-    def test_cbor2json(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.cbor",
-            "cbor",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("example.json")
-        assert output == reference
-
-    def test_cbor2msgpack(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "example.cbor",
-            "cbor",
-            "msgpack",
-        )
-        reference = read_file("example.msgpack")
-        assert output == reference
-
-    def test_cbor2toml(self, convert_and_read) -> None:
-        output = convert_and_read("example.cbor", "cbor", "toml")
-        reference = read_file("example.toml")
-        output_sig = toml_signature(output)
-        reference_sig = toml_signature(reference)
-        assert output_sig == reference_sig
-
-    def test_cbor2yaml(self, convert_and_read) -> None:
-        output = convert_and_read("example.cbor", "cbor", "yaml")
-        reference = read_file("example.yaml")
-        assert output == reference
-
     def test_missing_wrap(self, convert_and_read) -> None:
         with pytest.raises(TypeError):
             convert_and_read("array.json", "json", "toml")
@@ -423,17 +384,187 @@ class TestRemarshal:
         reference = read_file("array.json")
         assert output == reference
 
-    def test_malformed_json(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("garbage", "json", "yaml")
+    def test_large_input(self, tmp_path) -> None:
+        data = {f"key{i}": [f"value{i}" * 20, i, i % 2 == 0] for i in range(1000)}
+        path = tmp_path / "large.json"
+        path.write_text(json.dumps(data))
+
+        for from_, to in (
+            ("json", "cbor"),
+            ("cbor", "msgpack"),
+            ("msgpack", "yaml"),
+            ("yaml", "toml"),
+            ("toml", "json"),
+        ):
+            assert path.stat().st_size >= MMAP_THRESHOLD
+            new_path = tmp_path / f"large.{to}"
+            remarshal.remarshal(from_, to, path, new_path)
+            path = new_path
+
+        assert json.loads(path.read_bytes()) == data
+
+    def test_large_input_unmappable(self, tmp_path, monkeypatch) -> None:
+        def fail(*_args: Any, **_kwargs: Any) -> NoReturn:
+            raise OSError(errno.ENODEV, "No such device")
+
+        monkeypatch.setattr(mmap, "mmap", fail)
 
-    def test_malformed_toml(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("garbage", "toml", "yaml")
+        data = {f"key{i}": f"value{i}" * 20 for i in range(1000)}
+        path = tmp_path / "large.yaml"
+        # JSON is a subset of YAML.
+        path.write_text(json.dumps(data))
+        assert path.stat().st_size >= MMAP_THRESHOLD
+
+        output = tmp_path / "large-output.json"
+        remarshal.remarshal("yaml", "json", path, output)
+
+        assert json.loads(output.read_bytes()) == data
+
+    def test_map_input_non_regular_file(self) -> None:
+        read_fd, write_fd = os.pipe()
+        try:
+            assert _map_input(read_fd) is None
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_deep_nesting_json(self, tmp_path) -> None:
+        # Only JSON output is checked.
+        # The TOML and YAML libraries recurse on their own at this depth.
+        depth = 900
+        path = tmp_path / "deep.json"
+        path.write_text("[" * depth + "]" * depth)
+
+        output = tmp_path / "deep-output.json"
+        remarshal.remarshal("json", "json", path, output)
+
+        assert output.read_text() == "[" * depth + "]" * depth + "\n"
+
+    def test_traverse_scalar_root(self) -> None:
+        assert remarshal.traverse("x") == "x"
+        assert remarshal.traverse(5, default_callback=str) == "5"
+
+    def test_traverse_callbacks(self) -> None:
+        def sorted_dict(pairs: Sequence[tuple[Any, Any]]) -> dict[Any, Any]:
+            return dict(sorted(pairs))
+
+        result = remarshal.traverse(
+            {"b": [1, "x", {"d": 2, "c": None}], "a": 3},
+            dict_callback=sorted_dict,
+            list_callback=tuple,
+            key_callback=str.upper,
+            instance_callbacks=[(int, lambda x: x * 10)],
+            default_callback=repr,
+        )
+
+        assert result == {"A": 30, "B": (10, "'x'", {"C": "None", "D": 20})}
+        assert list(result) == ["A", "B"]
+        assert list(result["B"][2]) == ["C", "D"]
+
+    def test_traverse_shared_container(self) -> None:
+        shared = {"a": [1]}
+        result = remarshal.traverse([shared, shared], list_callback=tuple)
+
+        assert result == ({"a": (1,)}, {"a": (1,)})
+
+    def test_traverse_deep_list(self) -> None:
+        depth = 10_000
+        doc: list[Any] = []
+        for _ in range(depth):
+            doc = [doc]
+
+        node = remarshal.traverse(doc, list_callback=tuple)
+
+        # Walk the result with a loop since `==` would recurse.
+        for _ in range(depth):
+            assert isinstance(node, tuple)
+            assert len(node) == 1
+            node = node[0]
+        assert node == ()
+
+    def test_traverse_deep_dict(self) -> None:
+        depth = 10_000
+        doc: dict[str, Any] = {}
+        for _ in range(depth):
+            doc = {"k": doc}
+
+        node = remarshal.traverse(doc, key_callback=str.upper)
+
+        for _ in range(depth):
+            assert list(node) == ["K"]
+            node = node["K"]
+        assert node == {}
+
+    def test_traverse_circular_list(self) -> None:
+        doc: list[Any] = [1]
+        doc.append([doc])
+
+        with pytest.raises(ValueError, match="circular reference"):
+            remarshal.traverse(doc)
+
+    def test_traverse_circular_dict(self) -> None:
+        doc: dict[str, Any] = {"a": 1}
+        doc["self"] = {"inner": doc}
+
+        with pytest.raises(ValueError, match="circular reference"):
+            remarshal.traverse(doc)
+
+    def test_circular_reference(self, tmp_path) -> None:
+        path = tmp_path / "circular.yaml"
+        path.write_text("a: &x [1, *x]\n")
+
+        output = tmp_path / "circular.json"
+
+        with pytest.raises(ValueError, match="(?i)circular reference"):
+            remarshal.remarshal("yaml", "json", path, output)
+
+        with pytest.raises(ValueError, match="(?i)circular reference"):
+            remarshal.remarshal("yaml", "json", path, output, max_values=-1)
+
+    @pytest.mark.parametrize(
+        ("doc", "maximum"),
+        [
+            ({}, 0),
+            ([], 0),
+            ([1, 2, 3], 3),
+            ({"a": [1, {"b": 2}], "c": 3}, 3),
+            ([[1]] * 600, 1000),
+            ([[[[[1]]]]], 1),
+        ],
+    )
+    def test_value_count_within_limit(self, doc: Any, maximum: int) -> None:
+        _validate_value_count(doc, maximum=maximum)
+
+    @pytest.mark.parametrize(
+        ("doc", "maximum"),
+        [
+            ([1], 0),
+            ([1, 2, 3], 2),
+            ({"a": [1, {"b": 2}], "c": 3}, 2),
+            ([[1]] * 600, 599),
+        ],
+    )
+    def test_value_count_over_limit(self, doc: Any, maximum: int) -> None:
+        with pytest.raises(remarshal.TooManyValuesError):
+            _validate_value_count(doc, maximum=maximum)
+
+    def test_value_count_shared_containers(self) -> None:
+        # Every occurrence of a shared container counts.
+        shared = [1, 2]
+        _validate_value_count([shared] * 5, maximum=10)
 
-    def test_malformed_yaml(self, convert_and_read) -> None:
+        with pytest.raises(remarshal.TooManyValuesError):
+            _validate_value_count([shared] * 5, maximum=9)
+
+    @pytest.mark.parametrize(
+        ("input_format", "output_format"),
+        [("json", "yaml"), ("toml", "yaml"), ("yaml", "json")],
+    )
+    def test_malformed(
+        self, convert_and_read, input_format: str, output_format: str
+    ) -> None:
         with pytest.raises(ValueError):
-            convert_and_read("garbage", "yaml", "json")
+            convert_and_read("garbage", input_format, output_format)
 
     def test_binary_to_json(self, convert_and_read) -> None:
         with pytest.raises(ValueError):
@@ -486,35 +617,26 @@ class TestRemarshal:
         reference = read_file("long-line-gt.yaml")
         assert output == reference
 
-    def test_argv0_to_format(self) -> None:
-        def test_format_string(s: str) -> None:
-            for from_str in "json", "toml", "yaml":
-                for to_str in "json", "toml", "yaml":
-                    from_parsed, to_parsed = _argv0_to_format(
-                        s.format(from_str, to_str)
-                    )
-                    assert (from_parsed, to_parsed) == (from_str, to_str)
-
-        test_format_string("{0}2{1}")
-        test_format_string("{0}2{1}.exe")
-        test_format_string("{0}2{1}-script.py")
-
-    def test_format_detection(self) -> None:
-        ext_to_fmt = {
-            "json": "json",
-            "toml": "toml",
-            "yaml": "yaml",
-            "yml": "yaml",
-        }
+    @pytest.mark.parametrize(
+        "template", ["{0}2{1}", "{0}2{1}.exe", "{0}2{1}-script.py"]
+    )
+    @pytest.mark.parametrize("from_str", ["json", "toml", "yaml"])
+    @pytest.mark.parametrize("to_str", ["json", "toml", "yaml"])
+    def test_argv0_to_format(self, template: str, from_str: str, to_str: str) -> None:
+        argv0 = template.format(from_str, to_str)
+        assert _argv0_to_format(argv0) == (from_str, to_str)
 
-        for from_ext in ext_to_fmt:
-            for to_ext in ext_to_fmt:
-                args = _parse_command_line(
-                    [sys.argv[0], "input." + from_ext, "output." + to_ext]
-                )
+    @pytest.mark.parametrize(("from_ext", "input_format"), DETECTED_FORMATS)
+    @pytest.mark.parametrize(("to_ext", "output_format"), DETECTED_FORMATS)
+    def test_format_detection(
+        self, from_ext: str, input_format: str, to_ext: str, output_format: str
+    ) -> None:
+        args = _parse_command_line(
+            [sys.argv[0], "input." + from_ext, "output." + to_ext]
+        )
 
-                assert args.input_format == ext_to_fmt[from_ext]
-                assert args.output_format == ext_to_fmt[to_ext]
+        assert args.input_format == input_format
+        assert args.output_format == output_format
 
     def test_format_detection_failure_input_stdin(self) -> None:
         with pytest.raises(SystemExit) as cm:
@@ -531,6 +653,19 @@ class TestRemarshal:
             _parse_command_line([sys.argv[0], "input.json", "output.txt"])
         assert cm.value.code == 2
 
+    def test_parser_sets_up_rich_once(self, monkeypatch) -> None:
+        import colorama
+
+        calls = []
+        monkeypatch.setattr(colorama, "init", lambda: calls.append(None))
+
+        parser = _ArgumentParser(prog="remarshal")
+        for _ in range(2):
+            with pytest.raises(SystemExit):
+                parser.error("bad argument")
+
+        assert len(calls) == 1
+
     def test_run_no_args(self) -> None:
         with pytest.raises(SystemExit) as cm:
             run(sys.argv[0])
@@ -574,54 +709,38 @@ class TestRemarshal:
             run(sys.argv[0], data_file_path("array.toml"))
         assert cm.value.code == 2
 
-    def test_run_short_commands(self) -> None:
-        for output_format in ["cbor", "json", "msgpack", "toml", "yaml"]:
-            run(
-                f"json2{output_format}",
-                "-i",
-                data_file_path("example.json"),
-            )
+    @pytest.mark.parametrize("output_format", SHORT_COMMAND_FORMATS)
+    def test_run_short_commands(self, output_format: str) -> None:
+        run(
+            f"json2{output_format}",
+            "-i",
+            data_file_path("example.json"),
+        )
+
+    @pytest.mark.parametrize("from_", ORDER_FORMATS)
+    @pytest.mark.parametrize("to", ORDER_FORMATS)
+    def test_ordered_simple(self, convert_and_read, from_: str, to: str) -> None:
+        output = convert_and_read(
+            "order." + from_,
+            from_,
+            to,
+            indent=Defaults.JSON_INDENT,
+        )
+        reference = read_file("order." + to)
+        assert output == reference
 
-    def test_ordered_simple(self, convert_and_read) -> None:
-        formats = ("json", "toml")
-        for from_ in formats:
-            for to in formats:
-                output = convert_and_read(
-                    "order." + from_,
-                    from_,
-                    to,
-                    indent=Defaults.JSON_INDENT,
-                )
-                reference = read_file("order." + to)
-
-                message = "failed for {} to {} ({!r} instead of {!r})".format(
-                    from_,
-                    to,
-                    output,
-                    reference,
-                )
-                assert output == reference, message
-
-    def test_sort_keys_simple(self, convert_and_read) -> None:
-        formats = ("json", "toml")
-        for from_ in formats:
-            for to in formats:
-                output = convert_and_read(
-                    "sorted." + from_,
-                    from_,
-                    to,
-                    indent=Defaults.JSON_INDENT,
-                    sort_keys=True,
-                )
-                reference = read_file("sorted." + to)
-
-                message = "failed for {} to {} ({!r} instead of {!r})".format(
-                    from_,
-                    to,
-                    output,
-                    reference,
-                )
-                assert output == reference, message
+    @pytest.mark.parametrize("from_", ORDER_FORMATS)
+    @pytest.mark.parametrize("to", ORDER_FORMATS)
+    def test_sort_keys_simple(self, convert_and_read, from_: str, to: str) -> None:
+        output = convert_and_read(
+            "sorted." + from_,
+            from_,
+            to,
+            indent=Defaults.JSON_INDENT,
+            sort_keys=True,
+        )
+        reference = read_file("sorted." + to)
+        assert output == reference
 
     def test_yaml2json_bool_null_key(self, convert_and_read) -> None:
         output = convert_and_read(
@@ -674,6 +793,85 @@ class TestRemarshal:
         reference = read_file("timestamp-key.toml")
         assert output == reference
 
+    def test_yaml2json_timestamp_key(self, convert_and_read) -> None:
+        with pytest.raises(ValueError, match="date key"):
+            convert_and_read("timestamp-key.yaml", "yaml", "json")
+
+    def test_yaml2json_datetime_key(self, tmp_path) -> None:
+        path = tmp_path / "datetime-key.yaml"
+        path.write_text("2001-12-14 21:59:43: 1\n")
+
+        with pytest.raises(ValueError, match="date-time key"):
+            remarshal.remarshal("yaml", "json", path, tmp_path / "output.json")
+
+    @pytest.mark.parametrize(
+        ("key", "message"),
+        [
+            (True, "boolean key"),
+            (False, "boolean key"),
+            (None, "null key"),
+            (datetime.date(2001, 12, 14), "date key"),
+            (
+                datetime.datetime(
+                    2001, 12, 14, 21, 59, 43, tzinfo=datetime.timezone.utc
+                ),
+                "date-time key",
+            ),
+            (datetime.time(21, 59, 43), "time key"),
+        ],
+    )
+    def test_reject_special_keys(self, key: Any, message: str) -> None:
+        with pytest.raises(TypeError, match=f"^{message}$"):
+            _reject_special_keys(key)
+
+    @pytest.mark.parametrize("key", ["a", 1, 1.5, b"bytes", ("t", 1)])
+    def test_reject_special_keys_passes_others(self, key: Any) -> None:
+        assert _reject_special_keys(key) is key
+
+    @pytest.mark.parametrize("stringify", [False, True])
+    def test_yaml2json_shared_mapping(self, tmp_path, stringify) -> None:
+        path = tmp_path / "shared.yaml"
+        path.write_text("a: &x {k: [1, 2]}\nb: *x\nc: [*x, *x]\n")
+
+        output = tmp_path / "shared.json"
+        options = remarshal.format_options("json", stringify=stringify)
+        remarshal.remarshal("yaml", "json", path, output, options=options)
+
+        shared = {"k": [1, 2]}
+        assert json.loads(output.read_bytes()) == {
+            "a": shared,
+            "b": shared,
+            "c": [shared, shared],
+        }
+
+    def test_yaml2json_shared_mapping_stringify_keys(self, tmp_path) -> None:
+        path = tmp_path / "shared.yaml"
+        path.write_text("a: &x {true: 1}\nb: *x\n")
+
+        output = tmp_path / "shared.json"
+        options = remarshal.format_options("json", stringify=True)
+        remarshal.remarshal("yaml", "json", path, output, options=options)
+
+        assert json.loads(output.read_bytes()) == {"a": {"true": 1}, "b": {"true": 1}}
+
+    @pytest.mark.parametrize(
+        ("text", "message"),
+        [
+            ("a: {true: 1}\nnull: 2\n", "boolean key"),
+            ("- {null: 1}\n- {true: 1}\n", "null key"),
+            ("[{a: [{2001-12-14: 1}]}, {true: 1}]\n", "date key"),
+        ],
+    )
+    def test_yaml2json_first_special_key(
+        self, tmp_path, text: str, message: str
+    ) -> None:
+        # The first offending key in document order is reported.
+        path = tmp_path / "keys.yaml"
+        path.write_text(text)
+
+        with pytest.raises(ValueError, match=message):
+            remarshal.remarshal("yaml", "json", path, tmp_path / "keys.json")
+
     def test_yaml_colon(self, convert_and_read) -> None:
         output = convert_and_read(
             "colon.yaml",
@@ -689,17 +887,17 @@ class TestRemarshal:
             "json",
             "yaml",
         ).decode("utf-8")
-        assert len([char for char in output if char == "\n"]) == 4
+        assert output.count("\n") == 4
 
     def test_yaml_width_5(self, convert_and_read) -> None:
         output = convert_and_read("long-line.json", "json", "yaml", width=5).decode()
-        assert len([char for char in output if char == "\n"]) == 23
+        assert output.count("\n") == 23
 
     def test_yaml_width_120(self, convert_and_read) -> None:
         output = convert_and_read("long-line.json", "json", "yaml", width=120).decode(
             "utf-8"
         )
-        assert len([char for char in output if char == "\n"]) == 3
+        assert output.count("\n") == 3
 
     def test_yaml_ident_5(self, convert_and_read) -> None:
         output = convert_and_read(
@@ -708,7 +906,8 @@ class TestRemarshal:
             "yaml",
             indent=5,
         ).decode("utf-8")
-        assert set(re.findall(r"\n +", output)) == {"\n     ", "\n          "}
+        indents = {match.group() for match in YAML_INDENT_RE.finditer(output)}
+        assert indents == {"\n     ", "\n          "}
 
     def test_yaml2toml_empty_mapping(self, convert_and_read) -> None:
         with pytest.raises(ValueError):
@@ -757,137 +956,24 @@ class TestRemarshal:
         reference = read_file("norway.json")
         assert output == reference
 
-    def test_toml2cbor_date(self, convert_and_read) -> None:
-        output = convert_and_read("date.toml", "toml", "cbor")
-        reference = read_file("date.cbor")
-        assert output == reference
-
-    def test_toml2json_date(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("date.toml", "toml", "json")
-
-    def test_toml2json_date_stringify(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "date.toml",
-            "toml",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("date.json")
-        assert output == reference
-
-    def test_toml2msgpack_date(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("date.toml", "toml", "msgpack")
-
-    def test_toml2toml_date(self, convert_and_read) -> None:
-        output = convert_and_read("date.toml", "toml", "toml")
-        reference = read_file("date.toml")
-
-    def test_toml2yaml_date(self, convert_and_read) -> None:
-        output = convert_and_read("date.toml", "toml", "yaml")
-        reference = read_file("date.yaml")
-
-    def test_toml2cbor_datetime_local(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("datetime-local.toml", "toml", "cbor")
-
-    def test_toml2json_datetime_local(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("datetime-local.toml", "toml", "json")
-
-    def test_toml2json_datetime_local_stringify(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "datetime-local.toml",
-            "toml",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("datetime-local.json")
-        assert output == reference
-
-    def test_toml2msgpack_datetime_local(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("datetime-local.toml", "toml", "msgpack")
-
-    def test_toml2toml_datetime_local(self, convert_and_read) -> None:
-        output = convert_and_read("datetime-local.toml", "toml", "toml")
-        reference = read_file("datetime-local.toml")
-        assert output == reference
-
-    def test_toml2yaml_datetime_local(self, convert_and_read) -> None:
-        output = convert_and_read("datetime-local.toml", "toml", "yaml")
-        reference = read_file("datetime-local.yaml")
-        assert output == reference
-
-    def test_toml2cbor_datetime_tz(self, convert_and_read) -> None:
-        output = convert_and_read("datetime-tz.toml", "toml", "cbor")
-        reference = read_file("datetime-tz.cbor")
-        assert output == reference
-
-    def test_toml2json_datetime_tz(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("datetime-tz.toml", "toml", "json")
-
-    def test_toml2json_datetime_tz_stringify(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "datetime-tz.toml",
-            "toml",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("datetime-tz.json")
-        assert output == reference
-
-    def test_toml2msgpack_datetime_tz(self, convert_and_read) -> None:
-        output = convert_and_read("datetime-tz.toml", "toml", "msgpack")
-        reference = read_file("datetime-tz.msgpack")
-        assert output == reference
-
-    def test_toml2toml_datetime_tz(self, convert_and_read) -> None:
-        output = convert_and_read("datetime-tz.toml", "toml", "toml")
-        reference = read_file("datetime-tz.toml")
-        assert output == reference
-
-    def test_toml2yaml_datetime_tz(self, convert_and_read) -> None:
-        output = convert_and_read("datetime-tz.toml", "toml", "yaml")
-        reference = read_file("datetime-tz.yaml")
-        assert output == reference
-
-    def test_toml2cbor_time(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("time.toml", "toml", "cbor")
-
-    def test_toml2json_time(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("time.toml", "toml", "json")
-
-    def test_toml2json_time_stringify(self, convert_and_read) -> None:
-        output = convert_and_read(
-            "time.toml",
-            "toml",
-            "json",
-            indent=Defaults.JSON_INDENT,
-            stringify=True,
-        )
-        reference = read_file("time.json")
-        assert output == reference
-
-    def test_toml2msgpack_time(self, convert_and_read) -> None:
-        with pytest.raises(ValueError):
-            convert_and_read("time.toml", "toml", "msgpack")
-
-    def test_toml2toml_time_stringify(self, convert_and_read) -> None:
-        output = convert_and_read("time.toml", "toml", "toml")
-        reference = read_file("time.toml")
+    @pytest.mark.parametrize(("stem", "output_format", "kwargs"), DATETIME_CONVERSIONS)
+    def test_toml_datetime(
+        self,
+        convert_and_read,
+        stem: str,
+        output_format: str,
+        kwargs: dict[str, Any],
+    ) -> None:
+        output = convert_and_read(f"{stem}.toml", "toml", output_format, **kwargs)
+        reference = read_file(f"{stem}.{output_format}")
         assert output == reference
 
-    def test_toml2yaml_time(self, convert_and_read) -> None:
+    @pytest.mark.parametrize(("stem", "output_format"), DATETIME_FAILURES)
+    def test_toml_datetime_failure(
+        self, convert_and_read, stem: str, output_format: str
+    ) -> None:
         with pytest.raises(ValueError):
-            convert_and_read("time.toml", "toml", "yaml")
+            convert_and_read(f"{stem}.toml", "toml", output_format)
 
 
 if __name__ == "__main__":